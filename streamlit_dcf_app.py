@@ -4,65 +4,223 @@ import pandas as pd
 import numpy as np
 import yfinance as yf
 import altair as alt
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from io import StringIO
 
+try:
+    from numba import njit, prange, vectorize
+except ImportError:
+    njit = prange = vectorize = None
+
 st.set_page_config(page_title="DCF Portfolio Analyzer", layout="wide")
 
-def get_fcf(ticker):
-    stock = yf.Ticker(ticker)
-    cf = stock.cashflow
+@lru_cache(maxsize=128)
+def _ticker(symbol):
+    return yf.Ticker(symbol)
+
+@st.cache_data(ttl=60 * 60 * 24, show_spinner=False)
+def _cashflow_and_info(ticker):
+    stock = _ticker(ticker)
+    return stock.cashflow, stock.info
+
+def _fetch(ticker):
+    cf, info = _cashflow_and_info(ticker)
+    return ticker, cf, info
 
+def get_fcf(cf, info):
     if cf is None or cf.empty:
         return None
 
+    lower_index = cf.index.str.lower()
+
     def find_label(possible_labels):
         for label in possible_labels:
-            for idx in cf.index:
-                if label.lower() in idx.lower():
-                    return cf.loc[idx].iloc[0]
+            hits = lower_index.str.contains(label.lower(), regex=False)
+            if hits.any():
+                return cf.loc[cf.index[hits][0]].iloc[0]
         return None
 
     ocf = find_label(['Total Cash From Operating Activities', 'Operating Cash Flow'])
     capex = find_label(['Capital Expenditures', 'Capital Expenditures - Fixed Assets'])
 
     if ocf is None or capex is None:
-        return stock.info.get("freeCashflow", None)
+        return info.get("freeCashflow", None)
 
     return ocf + capex
 
 def dcf_valuation(fcf, discount_rate=0.10, growth_rate=0.05, projection_years=5, terminal_growth=0.025):
     if fcf is None or fcf <= 0:
         return None
-    npv = sum(
-        fcf * (1 + growth_rate) ** year / (1 + discount_rate) ** year
-        for year in range(1, projection_years + 1)
-    )
-    terminal_value = (fcf * (1 + growth_rate) ** projection_years) * (1 + terminal_growth) / (discount_rate - terminal_growth)
-    terminal_value_discounted = terminal_value / (1 + discount_rate) ** projection_years
-    return npv + terminal_value_discounted
+    # Closed-form sum of the geometric series fcf * r + ... + fcf * r**n
+    # with r = (1+g)/(1+d), instead of a Python loop over the years.
+    g1 = 1 + growth_rate
+    d1 = 1 + discount_rate
+    r = g1 / d1
+    if r == 1:
+        npv = fcf * projection_years
+    else:
+        npv = fcf * r * (1 - r ** projection_years) / (1 - r)
+    terminal_value = (fcf * g1 ** projection_years) * (1 + terminal_growth) / (discount_rate - terminal_growth)
+    return npv + terminal_value / d1 ** projection_years
+
+if njit is not None:
+    # Native-code DCF kernels for sensitivity sweeps and Monte Carlo runs,
+    # where the kernel is called once per (rate, scenario) grid cell and
+    # interpreter overhead would dominate. Only compiled when numba is
+    # installed; the app itself runs fine without it.
+    @njit(cache=True, fastmath=True)
+    def dcf_njit(fcf, discount_rate, growth_rate, projection_years, terminal_growth):
+        g1 = 1 + growth_rate
+        d1 = 1 + discount_rate
+        r = g1 / d1
+        if r == 1:
+            npv = fcf * projection_years
+        else:
+            npv = fcf * r * (1 - r ** projection_years) / (1 - r)
+        terminal_value = (fcf * g1 ** projection_years) * (1 + terminal_growth) / (discount_rate - terminal_growth)
+        return npv + terminal_value / d1 ** projection_years
+
+    @njit(cache=True, fastmath=True, parallel=True)
+    def dcf_grid(fcf, discount_rates, growth_rates, projection_years, terminal_growth):
+        out = np.empty((discount_rates.size, growth_rates.size))
+        for i in prange(discount_rates.size):
+            for j in range(growth_rates.size):
+                out[i, j] = dcf_njit(fcf, discount_rates[i], growth_rates[j], projection_years, terminal_growth)
+        return out
+
+    # Ufunc form: broadcasting builds e.g. a tickers x discount-rates panel
+    # in one call, dcf_ufunc(fcfs[:, None], d_grid[None, :], g, n, tg).
+    @vectorize(['float64(float64, float64, float64, int64, float64)'], fastmath=True)
+    def dcf_ufunc(fcf, discount_rate, growth_rate, projection_years, terminal_growth):
+        g1 = 1 + growth_rate
+        d1 = 1 + discount_rate
+        r = g1 / d1
+        if r == 1:
+            npv = fcf * projection_years
+        else:
+            npv = fcf * r * (1 - r ** projection_years) / (1 - r)
+        terminal_value = (fcf * g1 ** projection_years) * (1 + terminal_growth) / (discount_rate - terminal_growth)
+        return npv + terminal_value / d1 ** projection_years
+
+def dcf_vec(fcf, discount_rate, growth_rate, projection_years, terminal_growth):
+    """Closed-form DCF over an array of FCFs; NaN where FCF is missing or non-positive."""
+    fcf = np.asarray(fcf, dtype=np.float64)
+    g1 = 1 + growth_rate
+    d1 = 1 + discount_rate
+    r = g1 / d1
+    if r == 1:
+        npv = fcf * projection_years
+    else:
+        npv = fcf * r * (1 - r ** projection_years) / (1 - r)
+    terminal_value = (fcf * g1 ** projection_years) * (1 + terminal_growth) / (discount_rate - terminal_growth)
+    out = npv + terminal_value / d1 ** projection_years
+    out[~np.isfinite(out) | (fcf <= 0)] = np.nan
+    return out
+
+@st.cache_data(ttl=60 * 60 * 24, show_spinner=False)
+def fetch_financials(tickers):
+    """Network stage: FCF, shares outstanding and market price per ticker.
+
+    Cached on the ticker tuple so slider moves never touch the network."""
+    tickers = list(tickers)
+    with ThreadPoolExecutor(max_workers=min(32, max(len(tickers), 1))) as ex:
+        fetched = {sym: (cf, info) for sym, cf, info in ex.map(_fetch, tickers)}
+
+    cashflows = [fetched[ticker][0] for ticker in tickers]
+    infos = [fetched[ticker][1] for ticker in tickers]
+
+    fcfs = [get_fcf(cf, info) for cf, info in zip(cashflows, infos)]
+    return pd.DataFrame({
+        "Ticker": tickers,
+        "FCF": np.array([fcf if fcf is not None else np.nan for fcf in fcfs], dtype=np.float64),
+        "Shares Outstanding": np.array([info.get("sharesOutstanding") or np.nan for info in infos], dtype=np.float64),
+        "Market Price ($)": np.array([info.get("currentPrice") or np.nan for info in infos], dtype=np.float64),
+    })
+
+def value_portfolio(fin_df, shares, discount_rate, growth_rate, projection_years, terminal_growth):
+    """Valuation stage: pure array math over prefetched financials."""
+    intrinsic_values = dcf_vec(fin_df["FCF"].to_numpy(), discount_rate, growth_rate, projection_years, terminal_growth)
+    shares_outstanding = fin_df["Shares Outstanding"].to_numpy()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        value_per_share = np.where(shares_outstanding > 0, intrinsic_values / shares_outstanding, np.nan)
+
+    results_df = pd.DataFrame({
+        "Ticker": fin_df["Ticker"].to_numpy(),
+        "Shares": shares,
+        "DCF Value per Share ($)": value_per_share,
+        "Market Price ($)": fin_df["Market Price ($)"].to_numpy(),
+    })
+    results_df = results_df.round({"DCF Value per Share ($)": 2, "Market Price ($)": 2})
+    vps = results_df["DCF Value per Share ($)"].to_numpy()
+    mp = results_df["Market Price ($)"].to_numpy()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        diff = (vps - mp) / mp
+    flags = np.select([diff > 0.10, diff < -0.10], ["Undervalued", "Overvalued"], default="Fairly Valued")
+    results_df["Valuation"] = np.where(np.isnan(diff), None, flags)
+    return results_df
 
 def analyze_portfolio(df, discount_rate, growth_rate, projection_years, terminal_growth):
-    results = []
-    for _, row in df.iterrows():
-        ticker = row['Ticker']
-        shares = row['Shares']
-        fcf = get_fcf(ticker)
-        intrinsic_value = dcf_valuation(fcf, discount_rate, growth_rate, projection_years, terminal_growth)
+    fin_df = fetch_financials(tuple(df['Ticker']))
+    return value_portfolio(fin_df, df['Shares'].to_numpy(), discount_rate, growth_rate, projection_years, terminal_growth)
 
-        stock = yf.Ticker(ticker)
-        shares_outstanding = stock.info.get("sharesOutstanding", None)
-        current_price = stock.info.get("currentPrice", None)
+@st.cache_data(ttl=60 * 60 * 24, show_spinner=False)
+def historical_dcf_trend(tickers):
+    """Simple perpetuity DCF per share (10% discount, 5% growth) for each
+    reported cashflow year, as one long frame for the trend chart."""
+    frames = []
+    for ticker in tickers:
+        cf, info = _cashflow_and_info(ticker)
+        shares_outstanding = info.get("sharesOutstanding")
+        if cf is None or cf.empty or not shares_outstanding:
+            continue
+        lower_index = cf.index.str.lower()
+        ocf_hits = (lower_index.str.contains("operating cash flow", regex=False)
+                    | lower_index.str.contains("total cash from operating activities", regex=False))
+        capex_hits = lower_index.str.contains("capital expenditure", regex=False)
+        if not ocf_hits.any() or not capex_hits.any():
+            continue
+        rows = cf.loc[[cf.index[ocf_hits][0], cf.index[capex_hits][0]]].iloc[:, :5]
+        fcf = rows.sum(axis=0, skipna=False).dropna()
+        if fcf.empty:
+            continue
+        trend = (fcf * 1.05 / 0.05 / shares_outstanding).rename("DCF Value per Share ($)")
+        trend = trend.reset_index().rename(columns={"index": "Year"})
+        trend["Year"] = pd.to_datetime(trend["Year"]).dt.year
+        trend["Ticker"] = ticker
+        frames.append(trend)
+    if not frames:
+        return pd.DataFrame(columns=["Year", "DCF Value per Share ($)", "Ticker"])
+    return pd.concat(frames, ignore_index=True)
 
-        value_per_share = (intrinsic_value / shares_outstanding) if intrinsic_value and shares_outstanding else None
+@st.cache_data(show_spinner=False)
+def _comparison_chart_spec(display_df):
+    chart_df = display_df.melt(
+        id_vars="Ticker",
+        value_vars=["DCF Value per Share ($)", "Market Price ($)"],
+        var_name="Type",
+        value_name="Price"
+    )
 
-        results.append({
-            "Ticker": ticker,
-            "Shares": shares,
-            "DCF Value per Share ($)": round(value_per_share, 2) if value_per_share else None,
-            "Market Price ($)": round(current_price, 2) if current_price else None
-        })
+    base = alt.Chart(chart_df).encode(
+        x=alt.X('Ticker:N', title='Stock'),
+        y=alt.Y('Price:Q', title='Per Share Value ($)'),
+        color=alt.Color('Type:N'),
+        tooltip=['Ticker', 'Type', 'Price']
+    )
 
-    return pd.DataFrame(results)
+    bars = base.transform_filter(alt.datum.Type == "DCF Value per Share ($)").mark_bar()
+    line = base.transform_filter(alt.datum.Type == "Market Price ($)").mark_line(point=True, strokeDash=[4, 2])
+    return (bars + line).properties(height=400).to_dict()
+
+@st.cache_data(show_spinner=False)
+def _trend_chart_spec(trend_df):
+    return alt.Chart(trend_df).mark_line(point=True).encode(
+        x=alt.X('Year:O', title='Fiscal Year'),
+        y=alt.Y('DCF Value per Share ($):Q', title='DCF Value per Share ($)'),
+        color=alt.Color('Ticker:N'),
+        tooltip=['Ticker', 'Year', 'DCF Value per Share ($)']
+    ).properties(height=400).to_dict()
 
 st.title("📈 DCF Portfolio Analyzer")
 
@@ -93,33 +251,27 @@ NVDA,8
 JNJ,25
 """)
 
-portfolio_df = pd.read_csv(uploaded_file)
+try:
+    portfolio_df = pd.read_csv(uploaded_file, engine="pyarrow")
+except (ImportError, ValueError):
+    uploaded_file.seek(0)
+    portfolio_df = pd.read_csv(uploaded_file)
 
 if 'Ticker' not in portfolio_df.columns or 'Shares' not in portfolio_df.columns:
     st.error("CSV must include 'Ticker' and 'Shares' columns.")
 else:
+    # Combine duplicate lots of the same ticker so each ticker is fetched once.
+    portfolio_df = portfolio_df.groupby('Ticker', as_index=False, sort=False)['Shares'].sum()
     results_df = analyze_portfolio(portfolio_df, discount_rate, growth_rate, projection_years, terminal_growth)
-    display_df = results_df.dropna()
+    display_df = results_df.dropna(subset=["DCF Value per Share ($)", "Market Price ($)"])
     st.dataframe(display_df, use_container_width=True)
 
-    chart_df = display_df.melt(
-        id_vars="Ticker",
-        value_vars=["DCF Value per Share ($)", "Market Price ($)"],
-        var_name="Type",
-        value_name="Price"
-    )
-
     st.subheader("📊 DCF vs. Market Price per Stock")
 
-    base = alt.Chart(chart_df).encode(
-        x=alt.X('Ticker:N', title='Stock'),
-        y=alt.Y('Price:Q', title='Per Share Value ($)'),
-        color=alt.Color('Type:N'),
-        tooltip=['Ticker', 'Type', 'Price']
-    )
+    st.altair_chart(alt.Chart.from_dict(_comparison_chart_spec(display_df)), use_container_width=True)
 
-    bars = base.transform_filter(alt.datum.Type == "DCF Value per Share ($)").mark_bar()
-    line = base.transform_filter(alt.datum.Type == "Market Price ($)").mark_line(point=True, strokeDash=[4, 2])
-    chart = (bars + line).properties(height=400)
+    trend_df = historical_dcf_trend(tuple(display_df["Ticker"]))
+    if not trend_df.empty:
+        st.subheader("📉 Historical DCF Value per Share")
 
-    st.altair_chart(chart, use_container_width=True)
+        st.altair_chart(alt.Chart.from_dict(_trend_chart_spec(trend_df)), use_container_width=True)